@@ -2,8 +2,12 @@
 from __future__ import annotations
 
 import os
+import queue
 import sys
-from typing import List
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 
 import streamlit as st
 
@@ -11,8 +15,14 @@ import streamlit as st
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from rpi_search.parser import read_xml_bytes
-from rpi_search.structured_rm import iter_rm_records, especificacao_preview, RMRecord
-from rpi_search.matching_rm import match_records, Match
+from rpi_search.structured_rm import parse_rm_records_parallel, especificacao_preview, RMRecord
+from rpi_search.matching_rm import (
+    annotate_matches,
+    iter_match_batches,
+    match_sort_key,
+    Match,
+    NameIndex,
+)
 
 
 # ----------------------------
@@ -80,15 +90,28 @@ uploaded = st.file_uploader(
     type=["xml", "zip"],
 )
 
+query_mode = st.radio(
+    "Modo de consulta",
+    options=["texto", "curinga"],
+    format_func=lambda m: (
+        "Texto (exata + semelhantes)"
+        if m == "texto"
+        else "Curinga (ITA*, *ACOS, *ACOS*)"
+    ),
+    horizontal=True,
+)
+
 keyword = st.text_input(
     "Palavra-chave (Elemento nominativo)",
-    placeholder="Ex.: ITA AÇOS",
+    placeholder="Ex.: ITA AÇOS" if query_mode == "texto" else "Ex.: ITA* ou *ACOS*",
 )
 
 col1, col2 = st.columns([1, 1])
 
 with col1:
-    enable_similar = st.toggle("Buscar semelhantes", value=True)
+    enable_similar = st.toggle(
+        "Buscar semelhantes", value=True, disabled=query_mode == "curinga"
+    )
 
 with col2:
     threshold = st.number_input(
@@ -97,6 +120,7 @@ with col2:
         max_value=100,
         value=90,
         step=1,
+        disabled=query_mode == "curinga",
     )
 
 run = st.button("🚀 Pesquisar", type="primary", use_container_width=True)
@@ -107,50 +131,77 @@ run = st.button("🚀 Pesquisar", type="primary", use_container_width=True)
 @st.cache_data(show_spinner=False)
 def _parse_records(file_bytes: bytes, filename: str) -> List[RMRecord]:
     xml_bytes, _ = read_xml_bytes(file_bytes, filename)
-    return list(iter_rm_records(xml_bytes))
+    return parse_rm_records_parallel(xml_bytes)
+
+
+# cache_resource: o índice é construído uma vez por revista e compartilhado,
+# sem a cópia via pickle que o cache_data faria a cada execução. Só as
+# revistas mais recentes ficam em memória.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _build_index(file_bytes: bytes, filename: str) -> NameIndex:
+    return NameIndex.build(_parse_records(file_bytes, filename))
 
 
 # ----------------------------
-# Execução
+# Matching em segundo plano
 # ----------------------------
-if run:
-    if not uploaded:
-        st.error("Envie o arquivo RM####.xml (ou .zip com XML).")
-        st.stop()
+@dataclass
+class _MatchJob:
+    key: Tuple
+    cancel: threading.Event = field(default_factory=threading.Event)
+    done: threading.Event = field(default_factory=threading.Event)
+    batches: "queue.Queue[List[Match]]" = field(default_factory=queue.Queue)
+    matches: List[Match] = field(default_factory=list)
+    error: Optional[Exception] = None
 
-    if not keyword.strip():
-        st.error("Informe a palavra-chave.")
-        st.stop()
 
-    with st.spinner("Lendo e estruturando a revista..."):
-        records = _parse_records(uploaded.getvalue(), uploaded.name)
+def _run_match_job(job: _MatchJob, **kwargs) -> None:
+    try:
+        for batch in iter_match_batches(cancel=job.cancel, **kwargs):
+            job.batches.put(batch)
+    except Exception as e:
+        job.error = e
+    finally:
+        job.done.set()
 
-    with st.spinner("Executando matching..."):
-        matches: List[Match] = match_records(
-            records=records,
-            keyword=keyword,
-            threshold=int(threshold),
-            enable_similar=enable_similar,
-        )
 
-    if not matches:
-        st.warning("❌ Termo não encontrado.")
-        st.stop()
+def _start_match_job(key: Tuple, **kwargs) -> _MatchJob:
+    job = _MatchJob(key=key)
+    threading.Thread(
+        target=_run_match_job, args=(job,), kwargs=kwargs, daemon=True
+    ).start()
+    return job
 
-    st.success(f"✅ Resultados encontrados: {len(matches)} (exibindo até 100)")
 
+def _cancel_match_job() -> None:
+    job = st.session_state.pop("match_job", None)
+    if job is not None:
+        job.cancel.set()
+
+
+def _render_matches(matches: List[Match], query_mode: str) -> None:
     for i, m in enumerate(matches[:100], start=1):
         r = m.record
 
         badge_class = "badge-exata" if m.tipo == "EXATA" else "badge-sim"
-        badge_txt = (
-            "CORRESPONDÊNCIA EXATA"
-            if m.tipo == "EXATA"
-            else f"SEMELHANTE (score={m.score})"
-        )
+        if query_mode == "curinga":
+            badge_txt = "CORRESPONDÊNCIA AO PADRÃO"
+        elif m.tipo == "EXATA":
+            badge_txt = "CORRESPONDÊNCIA EXATA"
+        else:
+            badge_txt = f"SEMELHANTE (score={m.score})"
 
         esp_prev = especificacao_preview(r.especificacao)
 
+        scores_txt = " · ".join(f"{k}={v}" for k, v in (m.scores or {}).items())
+        scores_html = (
+            f'''<div class="small mono" style="margin-top:10px;">
+            <span class="label">Similaridade:</span> combinado={m.combined} · {scores_txt}
+          </div>'''
+            if m.scores
+            else ""
+        )
+
         st.markdown(f"""
         <div class="card">
           <div class="title">{r.elemento_nominativo or "-"}</div>
@@ -176,9 +227,107 @@ if run:
           <div class="small" style="margin-top:10px;">
             <div><span class="label">Especificação:</span> {esp_prev or "-"}</div>
           </div>
+
+          {scores_html}
         </div>
         """, unsafe_allow_html=True)
 
         if (r.especificacao or "").strip():
             with st.expander("Ver especificação completa"):
                 st.write(r.especificacao)
+
+
+# ----------------------------
+# Execução
+# ----------------------------
+# file_id muda a cada upload, mesmo para arquivos com o mesmo nome e tamanho
+job_key = (
+    uploaded.file_id if uploaded else None,
+    keyword,
+    int(threshold),
+    enable_similar,
+    query_mode,
+)
+
+# Qualquer mudança nos parâmetros cancela a busca em andamento
+job: Optional[_MatchJob] = st.session_state.get("match_job")
+if job is not None and job.key != job_key:
+    _cancel_match_job()
+    job = None
+
+if run:
+    if not uploaded:
+        st.error("Envie o arquivo RM####.xml (ou .zip com XML).")
+        st.stop()
+
+    if not keyword.strip():
+        st.error("Informe a palavra-chave.")
+        st.stop()
+
+    with st.spinner("Lendo e estruturando a revista..."):
+        records = _parse_records(uploaded.getvalue(), uploaded.name)
+        index = (
+            _build_index(uploaded.getvalue(), uploaded.name)
+            if query_mode == "curinga"
+            else None
+        )
+
+    _cancel_match_job()
+    job = _start_match_job(
+        job_key,
+        records=records,
+        keyword=keyword,
+        threshold=int(threshold),
+        enable_similar=enable_similar,
+        query_mode=query_mode,
+        index=index,
+    )
+    st.session_state["match_job"] = job
+
+if job is not None:
+    if query_mode == "curinga":
+        searching_txt = "buscando pelo padrão..."
+    elif enable_similar:
+        searching_txt = "buscando semelhantes..."
+    else:
+        searching_txt = "buscando correspondências exatas..."
+
+    status = st.empty()
+    results = st.empty()
+    changed = True
+
+    while True:
+        finished = job.done.is_set()
+
+        while True:
+            try:
+                job.matches.extend(job.batches.get_nowait())
+                changed = True
+            except queue.Empty:
+                break
+
+        if not finished:
+            # Atualizado a cada ciclo: permite que o Streamlit interrompa este
+            # loop quando o usuário altera os parâmetros.
+            status.info(f"⏳ Resultados até agora: {len(job.matches)} ({searching_txt})")
+
+        if changed:
+            job.matches.sort(key=match_sort_key)
+            if query_mode == "texto":
+                annotate_matches(job.matches[:100], keyword)
+            with results.container():
+                _render_matches(job.matches, query_mode)
+            changed = False
+
+        if finished:
+            break
+        time.sleep(0.1)
+
+    if job.error is not None:
+        status.error(f"Erro no matching: {job.error}")
+    elif not job.matches:
+        status.warning("❌ Termo não encontrado.")
+    else:
+        status.success(
+            f"✅ Resultados encontrados: {len(job.matches)} (exibindo até 100)"
+        )
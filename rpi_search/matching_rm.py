@@ -2,11 +2,13 @@
 from __future__ import annotations
 
 import re
+import threading
 import unicodedata
-from dataclasses import dataclass
-from typing import List
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 from rpi_search.structured_rm import RMRecord
 
@@ -19,35 +21,364 @@ def norm(s: str) -> str:
     return s
 
 
+# ----------------------------
+# Scorers disponíveis
+# ----------------------------
+SCORERS: Dict[str, Callable[..., float]] = {
+    "ratio": fuzz.ratio,
+    "partial_ratio": fuzz.partial_ratio,
+    "token_sort_ratio": fuzz.token_sort_ratio,
+    "token_set_ratio": fuzz.token_set_ratio,
+    "WRatio": fuzz.WRatio,
+}
+
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "token_set_ratio": 0.30,
+    "WRatio": 0.25,
+    "ratio": 0.15,
+    "partial_ratio": 0.15,
+    "token_sort_ratio": 0.15,
+}
+
+# Scorers para os quais ratio() é limite válido: mesmo comprimento e mesmo
+# multiconjunto de caracteres após norm() (token_sort só reordena tokens).
+_RATIO_BOUNDED = {"ratio", "token_sort_ratio"}
+
+
+def _length_bound(la: int, lb: int) -> float:
+    """Limite superior de ratio() usando só os comprimentos."""
+    total = la + lb
+    return 200.0 * min(la, lb) / total if total else 0.0
+
+
+@dataclass
+class ScorerCascade:
+    """
+    Cascata de similaridade:
+      1. limite barato O(1) pelo comprimento, quando o scorer de corte admite
+         limite superior (ratio / token_sort_ratio);
+      2. scorer de corte (`gate`) em lote, com `score_cutoff` do rapidfuzz;
+      3. demais scorers apenas para os aprovados no passo 2, compondo o
+         score ponderado (`combined`) e o detalhamento por scorer.
+
+    token_set_ratio, partial_ratio e WRatio não têm limite superior barato
+    utilizável (um subconjunto de tokens ou um trecho já dá 100, qualquer que
+    seja o comprimento): com esses gates o passo 1 é pulado (`has_cheap_bound`)
+    e o corte fica só com o `score_cutoff` do passo 2.
+
+    O corte continua sendo feito pelo `gate` (padrão: token_set_ratio),
+    preservando os resultados da busca anterior.
+    """
+
+    gate: str = "token_set_ratio"
+    weights: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_WEIGHTS))
+
+    def __post_init__(self) -> None:
+        unknown = [n for n in [self.gate, *self.weights] if n not in SCORERS]
+        if unknown:
+            raise ValueError(f"Scorer desconhecido: {', '.join(unknown)}")
+
+    @property
+    def has_cheap_bound(self) -> bool:
+        """True quando o gate admite o limite barato do passo 1."""
+        return self.gate in _RATIO_BOUNDED
+
+    def admits(self, kw: str, alvo: str, threshold: int) -> bool:
+        """Filtro barato: False apenas quando o gate certamente ficaria abaixo do limiar."""
+        if not self.has_cheap_bound:
+            return True
+        return _length_bound(len(kw), len(alvo)) >= threshold
+
+    def gate_scores(
+        self, kw: str, alvos: List[str], threshold: int
+    ) -> List[Tuple[int, int]]:
+        """Aplica o gate em lote; retorna (índice em `alvos`, score) dos aprovados."""
+        if not alvos:
+            return []
+        found = process.extract(
+            kw,
+            alvos,
+            scorer=SCORERS[self.gate],
+            score_cutoff=threshold,
+            limit=None,
+        )
+        return sorted((idx, int(score)) for _, score, idx in found)
+
+    def breakdown(
+        self, kw: str, alvo: str, known: Optional[Dict[str, int]] = None
+    ) -> Tuple[Dict[str, int], float]:
+        """Calcula todos os scorers ponderados; retorna (scores, combined)."""
+        scores: Dict[str, int] = dict(known or {})
+        for name in self.weights:
+            if name not in scores:
+                scores[name] = int(SCORERS[name](kw, alvo))
+
+        total_w = sum(self.weights.values())
+        if total_w <= 0:
+            return scores, 0.0
+        combined = sum(w * scores[n] for n, w in self.weights.items()) / total_w
+        return scores, round(combined, 1)
+
+
+# ----------------------------
+# Índice ordenado de nomes (prefixo / sufixo / curinga)
+# ----------------------------
+_MAX_CHAR = chr(0x10FFFF)
+_WILDCARDS = re.compile(r"[*?]+")
+
+QUERY_MODES = ("texto", "curinga")
+
+
+def _prefix_range(sorted_names: List[str], prefix: str) -> List[str]:
+    lo = bisect_left(sorted_names, prefix)
+    hi = bisect_left(sorted_names, prefix + _MAX_CHAR, lo)
+    return sorted_names[lo:hi]
+
+
+def _wildcard_regex(pattern: str) -> re.Pattern[str]:
+    parts = []
+    for ch in pattern:
+        if ch == "*":
+            parts.append(".*")
+        elif ch == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(ch))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+@dataclass
+class NameIndex:
+    """
+    Índice dos elementos nominativos normalizados de uma revista.
+
+    - `names`: nomes distintos, ordenados (consultas por prefixo via bisect)
+    - `reversed_names`: os mesmos nomes invertidos, ordenados (sufixo via bisect)
+    - `postings`: nome -> índices dos registros em `records`
+
+    Deve ser construído uma vez por revista com `NameIndex.build(records)` e
+    reutilizado com a mesma lista de registros.
+    """
+
+    names: List[str]
+    reversed_names: List[str]
+    postings: Dict[str, List[int]]
+
+    @classmethod
+    def build(cls, records: List[RMRecord]) -> NameIndex:
+        postings: Dict[str, List[int]] = {}
+        for i, r in enumerate(records):
+            alvo = norm(r.elemento_nominativo or "")
+            if alvo:
+                postings.setdefault(alvo, []).append(i)
+        names = sorted(postings)
+        return cls(
+            names=names,
+            reversed_names=sorted(n[::-1] for n in names),
+            postings=postings,
+        )
+
+    def prefix(self, prefix: str) -> List[str]:
+        """Nomes que começam com `prefix` (já normalizado)."""
+        return _prefix_range(self.names, prefix)
+
+    def suffix(self, suffix: str) -> List[str]:
+        """Nomes que terminam com `suffix` (já normalizado)."""
+        return [n[::-1] for n in _prefix_range(self.reversed_names, suffix[::-1])]
+
+    def wildcard(self, pattern: str) -> List[str]:
+        """
+        Nomes que casam com `pattern` (já normalizado), onde `*` é qualquer
+        sequência e `?` um caractere. O trecho literal inicial/final restringe
+        os candidatos pelos arrays ordenados; sem âncoras, o maior trecho
+        literal filtra por substring antes da regex.
+        """
+        if not _WILDCARDS.search(pattern):
+            return [pattern] if pattern in self.postings else []
+
+        literals = [p for p in _WILDCARDS.split(pattern) if p]
+        head = "" if pattern[0] in "*?" else literals[0]
+        tail = "" if pattern[-1] in "*?" else literals[-1]
+
+        if head and tail:
+            by_head, by_tail = self.prefix(head), self.suffix(tail)
+            candidates = by_head if len(by_head) <= len(by_tail) else by_tail
+        elif head:
+            candidates = self.prefix(head)
+        elif tail:
+            candidates = self.suffix(tail)
+        elif literals:
+            longest = max(literals, key=len)
+            candidates = [n for n in self.names if longest in n]
+        else:
+            candidates = self.names
+
+        if pattern == head + "*" and "?" not in head:
+            return list(candidates)
+
+        rx = _wildcard_regex(pattern)
+        return [n for n in candidates if rx.fullmatch(n)]
+
+    def record_ids(self, names: List[str]) -> List[int]:
+        """Índices (em ordem original) dos registros com os nomes informados."""
+        return sorted(i for n in names for i in self.postings.get(n, ()))
+
+
 @dataclass
 class Match:
     record: RMRecord
     tipo: str   # "EXATA" | "SEMELHANTE"
-    score: int  # 0..100
+    score: int  # 0..100 (scorer de corte)
+    combined: Optional[float] = None  # score ponderado da cascata
+    scores: Optional[Dict[str, int]] = None  # detalhamento por scorer
 
 
-def match_records(
+def match_sort_key(m: Match) -> Tuple[int, int]:
+    """Ordem de exibição: exatas primeiro, depois maior score (estável nos empates)."""
+    return (0 if m.tipo == "EXATA" else 1, -m.score)
+
+
+def annotate_matches(
+    matches: List[Match],
+    keyword: str,
+    cascade: Optional[ScorerCascade] = None,
+) -> None:
+    """
+    Preenche `scores` e `combined` dos matches informados (in-place).
+
+    A busca já detalha os semelhantes (`with_breakdown=True`); as exatas, que
+    não passam pelo gate, são detalhadas aqui, apenas quando exibidas.
+    Matches já anotados são ignorados.
+    """
+    cascade = cascade or ScorerCascade()
+    kw = norm(keyword)
+    for m in matches:
+        if m.scores is not None:
+            continue
+        known = {cascade.gate: m.score} if m.tipo == "SEMELHANTE" else None
+        m.scores, m.combined = cascade.breakdown(
+            kw, norm(m.record.elemento_nominativo or ""), known=known
+        )
+
+
+def iter_match_batches(
     records: List[RMRecord],
     keyword: str,
     threshold: int = 90,
     enable_similar: bool = True,
-) -> List[Match]:
+    cascade: Optional[ScorerCascade] = None,
+    query_mode: str = "texto",
+    index: Optional[NameIndex] = None,
+    batch_size: int = 5000,
+    cancel: Optional[threading.Event] = None,
+    with_breakdown: bool = True,
+) -> Iterator[List[Match]]:
+    """
+    Versão incremental de `match_records`.
+
+    Produz primeiro um lote com as correspondências exatas (passagem barata)
+    e depois os semelhantes, pontuando os candidatos em blocos de
+    `batch_size` registros; cada lote vem ordenado por score. Se `cancel`
+    for sinalizado, a geração é interrompida em até `batch_size` registros,
+    inclusive durante a passagem exata. Com `with_breakdown`, cada semelhante
+    já vem com `scores` e `combined` (passo 3 da cascata).
+
+    Modos de consulta (`query_mode`):
+      - "texto": correspondência exata (substring) + semelhantes (cascata)
+      - "curinga": `keyword` é um padrão com `*`/`?` (ex.: ITA*, *ACOS, *ACOS*),
+        resolvido pelo `index` (obrigatório: `NameIndex.build(records)`,
+        construído uma vez por revista e reutilizado entre consultas)
+    """
+    if query_mode not in QUERY_MODES:
+        raise ValueError(f"Modo de consulta inválido: {query_mode}")
+    if query_mode == "curinga" and index is None:
+        raise ValueError("O modo curinga exige um NameIndex (NameIndex.build(records))")
+
     kw = norm(keyword)
-    out: List[Match] = []
+    step = max(1, batch_size)
+
+    def cancelled() -> bool:
+        return cancel is not None and cancel.is_set()
+
+    if query_mode == "curinga":
+        if not kw or cancelled():
+            return
+        yield [
+            Match(record=records[i], tipo="EXATA", score=100)
+            for i in index.record_ids(index.wildcard(kw))
+        ]
+        return
+
+    cascade = cascade or ScorerCascade()
+    admits = cascade.admits if cascade.has_cheap_bound else None
+    exact: List[Match] = []
+    candidates: List[Tuple[RMRecord, str]] = []
+
+    for i, r in enumerate(records):
+        if i % step == 0 and cancelled():
+            return
 
-    for r in records:
         alvo = norm(r.elemento_nominativo or "")
         if not alvo:
             continue
 
         if kw and kw in alvo:
-            out.append(Match(record=r, tipo="EXATA", score=100))
+            exact.append(Match(record=r, tipo="EXATA", score=100))
             continue
 
-        if enable_similar:
-            score = int(fuzz.token_set_ratio(kw, alvo))
-            if score >= threshold:
-                out.append(Match(record=r, tipo="SEMELHANTE", score=score))
+        if enable_similar and (admits is None or admits(kw, alvo, threshold)):
+            candidates.append((r, alvo))
+
+    yield exact  # todas com score 100, já na ordem do arquivo
+
+    for start in range(0, len(candidates), step):
+        if cancelled():
+            return
+
+        block = candidates[start:start + step]
+        batch: List[Match] = []
+        for idx, score in cascade.gate_scores(kw, [alvo for _, alvo in block], threshold):
+            r, alvo = block[idx]
+            m = Match(record=r, tipo="SEMELHANTE", score=score)
+            if with_breakdown:
+                m.scores, m.combined = cascade.breakdown(
+                    kw, alvo, known={cascade.gate: score}
+                )
+            batch.append(m)
+
+        if batch:
+            batch.sort(key=match_sort_key)
+            yield batch
+
+
+def match_records(
+    records: List[RMRecord],
+    keyword: str,
+    threshold: int = 90,
+    enable_similar: bool = True,
+    cascade: Optional[ScorerCascade] = None,
+    query_mode: str = "texto",
+    index: Optional[NameIndex] = None,
+    with_breakdown: bool = True,
+) -> List[Match]:
+    """
+    Executa `iter_match_batches` até o fim e devolve a lista completa ordenada.
+    Com `with_breakdown`, os semelhantes já vêm detalhados; as exatas podem ser
+    detalhadas com `annotate_matches`. No modo curinga, `index` é obrigatório e
+    deve ser mantido em cache pelo chamador.
+    """
+    out: List[Match] = []
+    for batch in iter_match_batches(
+        records,
+        keyword,
+        threshold=threshold,
+        enable_similar=enable_similar,
+        cascade=cascade,
+        query_mode=query_mode,
+        index=index,
+        with_breakdown=with_breakdown,
+    ):
+        out.extend(batch)
 
-    out.sort(key=lambda m: (0 if m.tipo == "EXATA" else 1, -m.score))
+    out.sort(key=match_sort_key)
     return out
@@ -1,9 +1,14 @@
 # rpi_search/structured_rm.py
 from __future__ import annotations
 
+import multiprocessing
+import os
 import re
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
-from typing import Iterator, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from lxml import etree
 
@@ -74,8 +79,29 @@ def iter_rm_records(xml_bytes: bytes, max_records: int = 200000) -> Iterator[RMR
         </processo>
       </revista>
     """
+    yield from _iter_rm_root(_parse_rm_root(xml_bytes), max_records)
+
+
+def _parse_rm_root(xml_bytes: bytes) -> etree._Element:
     parser = etree.XMLParser(recover=True, huge_tree=True)
-    root = etree.fromstring(xml_bytes, parser=parser)
+    return etree.fromstring(xml_bytes, parser=parser)
+
+
+def _iter_rm_root(root: etree._Element, max_records: int) -> Iterator[RMRecord]:
+    for row in _iter_rm_rows(root, max_records):
+        yield RMRecord(*row)
+
+
+def _iter_rm_rows(root: etree._Element, max_records: int) -> Iterator[tuple]:
+    """
+    Linhas na ordem dos campos de RMRecord. Valores categóricos (despacho,
+    país/UF, apresentação, natureza, NCL, status) são internados: repetem-se
+    muito, ocupam menos memória e o pickle dos workers os envia uma vez só.
+    """
+    memo: Dict[str, str] = {}
+
+    def intern(v: Optional[str]) -> Optional[str]:
+        return v if v is None else memo.setdefault(v, v)
 
     revista_numero = root.get("numero", "") or ""
     revista_data = root.get("data", "") or ""
@@ -92,23 +118,23 @@ def iter_rm_records(xml_bytes: bytes, max_records: int = 200000) -> Iterator[RMR
         despacho_codigo = despacho_nome = None
         desp = proc.find("despachos/despacho")
         if desp is not None:
-            despacho_codigo = desp.get("codigo")
-            despacho_nome = desp.get("nome")
+            despacho_codigo = intern(desp.get("codigo"))
+            despacho_nome = intern(desp.get("nome"))
 
         # titular (primeiro)
         titular_nome = titular_pais = titular_uf = None
         tit = proc.find("titulares/titular")
         if tit is not None:
             titular_nome = tit.get("nome-razao-social")
-            titular_pais = tit.get("pais")
-            titular_uf = tit.get("uf")
+            titular_pais = intern(tit.get("pais"))
+            titular_uf = intern(tit.get("uf"))
 
         # marca
         apresentacao = natureza = elemento = None
         marca = proc.find("marca")
         if marca is not None:
-            apresentacao = marca.get("apresentacao")
-            natureza = marca.get("natureza")
+            apresentacao = intern(marca.get("apresentacao"))
+            natureza = intern(marca.get("natureza"))
             nome_el = marca.find("nome")
             if nome_el is not None and (nome_el.text or "").strip():
                 elemento = (nome_el.text or "").strip()
@@ -125,7 +151,7 @@ def iter_rm_records(xml_bytes: bytes, max_records: int = 200000) -> Iterator[RMR
             continue
 
         for cn in lista.findall("classe-nice"):
-            ncl = cn.get("codigo")
+            ncl = intern(cn.get("codigo"))
 
             especificacao = None
             esp_el = cn.find("especificacao")
@@ -135,30 +161,193 @@ def iter_rm_records(xml_bytes: bytes, max_records: int = 200000) -> Iterator[RMR
             status_txt = None
             st_el = cn.find("status")
             if st_el is not None and (st_el.text or "").strip():
-                status_txt = (st_el.text or "").strip()
-
-            yield RMRecord(
-                revista_numero=revista_numero,
-                revista_data=revista_data,
-                processo_numero=processo_numero,
-                data_deposito=data_deposito,
-                data_concessao=data_concessao,
-                data_vigencia=data_vigencia,
-                despacho_codigo=despacho_codigo,
-                despacho_nome=despacho_nome,
-                titular_nome=titular_nome,
-                titular_pais=titular_pais,
-                titular_uf=titular_uf,
-                apresentacao=apresentacao,
-                natureza=natureza,
-                elemento_nominativo=elemento,
-                ncl=ncl,
-                status=status_txt,
-                especificacao=especificacao,
-                procurador=procurador,
+                status_txt = intern((st_el.text or "").strip())
+
+            yield (
+                revista_numero,
+                revista_data,
+                processo_numero,
+                data_deposito,
+                data_concessao,
+                data_vigencia,
+                despacho_codigo,
+                despacho_nome,
+                titular_nome,
+                titular_pais,
+                titular_uf,
+                apresentacao,
+                natureza,
+                elemento,
+                ncl,
+                status_txt,
+                especificacao,
+                procurador,
             )
 
             count += 1
             if count >= max_records:
                 return
 
+
+
+# ----------------------------
+# Parsing paralelo (1 revista grande -> N faixas de bytes)
+# ----------------------------
+_PROCESSO_TAG = re.compile(rb"<processo[\s>/]|</processo\s*>")
+_REVISTA_CLOSE = b"</revista>"
+
+# Teto de workers quando `workers` não é informado: cada worker importa o lxml
+# e mantém uma cópia da sua faixa em memória.
+_MAX_DEFAULT_WORKERS = 4
+
+# forkserver (POSIX): o servidor importa o __main__ (no Streamlit, o próprio
+# Streamlit) uma vez e cada worker nasce de um fork dele, em vez de reimportar
+# tudo como no spawn. Ambos são seguros no servidor multi-thread.
+_MP_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _default_workers() -> int:
+    """CPUs realmente disponíveis para o processo (afinidade), com teto."""
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:  # sched_getaffinity não existe no Windows/macOS
+        available = os.cpu_count() or 1
+    return max(1, min(available, _MAX_DEFAULT_WORKERS))
+
+
+def _split_rm_chunks(
+    xml_bytes: bytes, n_chunks: int
+) -> Tuple[bytes, List[bytes], List[int]]:
+    """
+    Divide o corpo da revista em até `n_chunks` faixas de bytes equilibradas,
+    sempre em fronteiras de </processo>.
+
+    Retorna (cabeçalho, faixas, nº de <processo> em cada faixa), tudo a partir
+    de uma única varredura dos bytes. O cabeçalho vai do início do arquivo até
+    o primeiro <processo> (declaração XML + <revista ...>). Lista vazia de
+    faixas indica que não foi possível dividir, inclusive quando há um
+    <processo> após o último </processo> (arquivo truncado: o parser serial,
+    com recover, ainda lê esse registro).
+    """
+    start = -1
+    n_open = 0
+    ends: List[int] = []    # fim de cada </processo>
+    opened: List[int] = []  # nº de <processo> vistos até esse </processo>
+    for m in _PROCESSO_TAG.finditer(xml_bytes):
+        if xml_bytes[m.start() + 1] == 0x2F:  # "/"
+            ends.append(m.end())
+            opened.append(n_open)
+        else:
+            if start < 0:
+                start = m.start()
+            n_open += 1
+
+    if start < 0 or not ends or n_open != opened[-1]:
+        return b"", [], []
+
+    step = (ends[-1] - start) / max(1, n_chunks)
+
+    cuts = [-1]  # índices em `ends`; -1 = início do primeiro <processo>
+    for i in range(1, n_chunks):
+        j = bisect_left(ends, start + int(step * i))
+        if j > cuts[-1] and j < len(ends) - 1:
+            cuts.append(j)
+    cuts.append(len(ends) - 1)
+
+    def pos(j: int) -> int:
+        return start if j < 0 else ends[j]
+
+    def count(j: int) -> int:
+        return 0 if j < 0 else opened[j]
+
+    pairs = list(zip(cuts, cuts[1:]))
+    return (
+        xml_bytes[:start],
+        [xml_bytes[pos(a):pos(b)] for a, b in pairs],
+        [count(b) - count(a) for a, b in pairs],
+    )
+
+
+def _header_is_clean(header: bytes) -> bool:
+    """O cabeçalho (sem recover) precisa fechar como uma <revista> vazia válida."""
+    try:
+        root = etree.fromstring(header + _REVISTA_CLOSE, parser=etree.XMLParser(huge_tree=True))
+    except etree.XMLSyntaxError:
+        return False
+    return root.tag == "revista"
+
+
+def _parse_rm_chunk(chunk_xml: bytes, max_records: int) -> Tuple[int, List[tuple]]:
+    """
+    Worker: retorna (nº de <processo> lidos, linhas). As linhas são tuplas na
+    ordem dos campos de RMRecord, bem mais baratas de serializar entre
+    processos do que as instâncias.
+    """
+    root = _parse_rm_root(chunk_xml)
+    n_processos = len(root.findall("processo"))
+    return n_processos, list(_iter_rm_rows(root, max_records))
+
+
+def parse_rm_records_parallel(
+    xml_bytes: bytes,
+    max_records: int = 200000,
+    workers: Optional[int] = None,
+    min_chunk_bytes: int = 4 * 1024 * 1024,
+) -> List[RMRecord]:
+    """
+    Versão paralela de `list(iter_rm_records(xml_bytes))` para revistas grandes.
+
+    Localiza as fronteiras <processo>/</processo> nos bytes brutos, divide o
+    arquivo em faixas equilibradas e processa cada faixa em um processo
+    separado (contexto "forkserver" ou "spawn", seguros dentro do servidor
+    multi-thread do Streamlit), envolvida pelo cabeçalho <revista ...> original. Os resultados
+    são concatenados na ordem do arquivo, com o mesmo conteúdo e ordem do
+    parser serial.
+
+    Usa o parser serial quando:
+      - o arquivo é menor que `min_chunk_bytes`, não tem fronteiras ou tem
+        um <processo> não fechado no final;
+      - há comentários/CDATA (onde "<processo" pode aparecer como texto) ou o
+        cabeçalho não é XML limpo;
+      - o número de <processo> lidos em alguma faixa difere do encontrado na
+        varredura de bytes (registros seriam perdidos silenciosamente);
+      - o pool de processos falha (ex.: script sem `if __name__ == "__main__"`,
+        limite de processos do sistema).
+
+    Sem `workers`, usa as CPUs disponíveis ao processo (afinidade), até
+    `_MAX_DEFAULT_WORKERS`.
+
+    A parte serial que resta é a desserialização das linhas e a montagem dos
+    RMRecord no processo principal (além da cópia de cada faixa enviada aos
+    workers), o que limita o ganho em máquinas com muitos núcleos.
+    """
+    workers = workers or _default_workers()
+    n_chunks = min(workers, len(xml_bytes) // max(1, min_chunk_bytes))
+
+    header, chunks, expected = (b"", [], [])
+    if n_chunks > 1 and b"<!--" not in xml_bytes and b"<![CDATA[" not in xml_bytes:
+        header, chunks, expected = _split_rm_chunks(xml_bytes, n_chunks)
+
+    if len(chunks) < 2 or not _header_is_clean(header):
+        return list(iter_rm_records(xml_bytes, max_records=max_records))
+
+    payloads = [header + c + _REVISTA_CLOSE for c in chunks]
+
+    out: List[RMRecord] = []
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(payloads)),
+            mp_context=multiprocessing.get_context(_MP_START_METHOD),
+        ) as ex:
+            parts = ex.map(_parse_rm_chunk, payloads, [max_records] * len(payloads))
+            for n_expected, (n_processos, rows) in zip(expected, parts):
+                if n_processos != n_expected:
+                    return list(iter_rm_records(xml_bytes, max_records=max_records))
+                out.extend(RMRecord(*row) for row in rows)
+                if len(out) >= max_records:
+                    return out[:max_records]
+    except (BrokenProcessPool, OSError, RuntimeError):
+        return list(iter_rm_records(xml_bytes, max_records=max_records))
+    return out
@@ -0,0 +1,166 @@
+import re
+import threading
+
+import pytest
+from rapidfuzz import fuzz
+
+from rpi_search.matching_rm import (
+    NameIndex,
+    ScorerCascade,
+    iter_match_batches,
+    match_records,
+    match_sort_key,
+    norm,
+)
+from rpi_search.structured_rm import RMRecord
+
+NAMES = [
+    "ITA AÇOS", "ITAÚ", "ITALIA AÇOS", "AÇOS ITA", "ITA  ACOS LTDA", "MEGA AÇOS",
+    "ITAACOS", "IT ACOS", "ITA", "AÇOS", "", "FERRO E AÇO", "ITA AÇOS", "IBA ACOS",
+    "TAÇOS", "A", "ITAGUAÇU", "BRASIL", "ACOSTA", "ITA-ACOS",
+]
+
+
+def _record(i: int, nome: str) -> RMRecord:
+    return RMRecord(
+        revista_numero="2800", revista_data="02/01/2024", processo_numero=str(i),
+        data_deposito=None, data_concessao=None, data_vigencia=None,
+        despacho_codigo=None, despacho_nome=None,
+        titular_nome=None, titular_pais=None, titular_uf=None,
+        apresentacao=None, natureza=None, elemento_nominativo=nome or None,
+        ncl="9", status=None, especificacao=None, procurador=None,
+    )
+
+
+RECORDS = [_record(i, n) for i, n in enumerate(NAMES)]
+
+
+def _baseline(records, keyword, threshold, enable_similar=True):
+    """Busca original: substring exata ou token_set_ratio >= limiar."""
+    kw = norm(keyword)
+    out = []
+    for r in records:
+        alvo = norm(r.elemento_nominativo or "")
+        if not alvo:
+            continue
+        if kw and kw in alvo:
+            out.append(("EXATA", 100, r.processo_numero))
+        elif enable_similar:
+            score = int(fuzz.token_set_ratio(kw, alvo))
+            if score >= threshold:
+                out.append(("SEMELHANTE", score, r.processo_numero))
+    out.sort(key=lambda m: (0 if m[0] == "EXATA" else 1, -m[1]))
+    return out
+
+
+@pytest.mark.parametrize("keyword", ["ITA AÇOS", "acos", "ita", "BRAZIL", ""])
+@pytest.mark.parametrize("threshold", [0, 50, 90])
+def test_match_records_matches_baseline(keyword, threshold):
+    got = match_records(RECORDS, keyword, threshold=threshold)
+    assert [(m.tipo, m.score, m.record.processo_numero) for m in got] == _baseline(
+        RECORDS, keyword, threshold
+    )
+
+
+def test_match_records_breaks_down_similar_matches():
+    cascade = ScorerCascade()
+    for m in match_records(RECORDS, "ITA AÇOS", threshold=50):
+        if m.tipo == "EXATA":
+            assert m.scores is None and m.combined is None
+            continue
+        expected = cascade.breakdown(norm("ITA AÇOS"), norm(m.record.elemento_nominativo))
+        assert (m.scores, m.combined) == expected
+        assert m.scores[cascade.gate] == m.score
+
+
+def test_ratio_gate_prefilter_keeps_baseline_results():
+    cascade = ScorerCascade(gate="ratio")
+    assert cascade.has_cheap_bound
+    got = match_records(RECORDS, "ITA AÇOS", threshold=60, cascade=cascade)
+    expected = [
+        r.processo_numero for r in RECORDS
+        if r.elemento_nominativo and "ITA ACOS" not in norm(r.elemento_nominativo)
+        and int(fuzz.ratio("ITA ACOS", norm(r.elemento_nominativo))) >= 60
+    ]
+    assert sorted(m.record.processo_numero for m in got if m.tipo == "SEMELHANTE") == sorted(expected)
+
+
+def test_default_gate_has_no_cheap_bound():
+    assert not ScorerCascade().has_cheap_bound
+
+
+def test_unknown_scorer_raises():
+    with pytest.raises(ValueError):
+        ScorerCascade(gate="foo")
+    with pytest.raises(ValueError):
+        ScorerCascade(weights={"foo": 1.0})
+
+
+def _brute_force_wildcard(records, pattern):
+    rx = re.compile("".join(
+        ".*" if ch == "*" else "." if ch == "?" else re.escape(ch) for ch in pattern
+    ), re.DOTALL)
+    return [
+        i for i, r in enumerate(records)
+        if norm(r.elemento_nominativo or "") and rx.fullmatch(norm(r.elemento_nominativo))
+    ]
+
+
+@pytest.mark.parametrize(
+    "pattern", ["ITA*", "*ACOS", "*ACOS*", "IT?*ACOS", "ITA**", "*", "?", "ITA ACOS", "ita*", "*ç*"]
+)
+def test_wildcard_matches_brute_force(pattern):
+    index = NameIndex.build(RECORDS)
+    kw = norm(pattern)
+    assert index.record_ids(index.wildcard(kw)) == _brute_force_wildcard(RECORDS, kw)
+
+
+def test_record_ids_in_file_order():
+    index = NameIndex.build(RECORDS)
+    ids = index.record_ids(["ITA", "ITA ACOS", "ACOS"])
+    assert ids == [0, 8, 9, 12]
+
+
+def test_curinga_match_records_uses_index():
+    index = NameIndex.build(RECORDS)
+    got = match_records(RECORDS, "ita*", query_mode="curinga", index=index)
+    assert [int(m.record.processo_numero) for m in got] == _brute_force_wildcard(RECORDS, "ITA*")
+    assert {m.tipo for m in got} == {"EXATA"}
+
+
+def test_curinga_without_index_raises():
+    with pytest.raises(ValueError):
+        match_records(RECORDS, "ITA*", query_mode="curinga")
+
+
+def test_batches_concatenated_equal_match_records():
+    batches = list(iter_match_batches(RECORDS, "ITA AÇOS", threshold=0, batch_size=3))
+    assert len(batches) > 2
+    joined = sorted((m for b in batches for m in b), key=match_sort_key)
+    assert joined == match_records(RECORDS, "ITA AÇOS", threshold=0)
+
+
+def test_first_batch_holds_only_exact_matches():
+    batches = iter_match_batches(RECORDS, "ITA AÇOS", threshold=0, batch_size=3)
+    first = next(batches)
+    assert first and {m.tipo for m in first} == {"EXATA"}
+    assert all(m.tipo == "SEMELHANTE" for b in batches for m in b)
+
+
+def test_preset_cancel_yields_nothing():
+    cancel = threading.Event()
+    cancel.set()
+    assert list(iter_match_batches(RECORDS, "ITA AÇOS", threshold=0, cancel=cancel)) == []
+    index = NameIndex.build(RECORDS)
+    assert list(iter_match_batches(
+        RECORDS, "ITA*", query_mode="curinga", index=index, cancel=cancel
+    )) == []
+
+
+def test_cancel_between_batches_stops_generation():
+    cancel = threading.Event()
+    batches = iter_match_batches(RECORDS, "ITA AÇOS", threshold=0, batch_size=2, cancel=cancel)
+    next(batches)
+    next(batches)
+    cancel.set()
+    assert list(batches) == []
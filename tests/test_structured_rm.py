@@ -0,0 +1,63 @@
+from rpi_search import structured_rm
+from rpi_search.structured_rm import iter_rm_records, parse_rm_records_parallel
+
+
+def _processo(numero: str) -> str:
+    return (
+        f'<processo numero="{numero}" data-deposito="01/01/2024">'
+        '<despachos><despacho codigo="IPAS009" nome="Publicação"/></despachos>'
+        f'<titulares><titular nome-razao-social="TITULAR {numero}" pais="BR" uf="SP"/></titulares>'
+        f'<marca apresentacao="Nominativa" natureza="Produto"><nome>MARCA {numero}</nome></marca>'
+        '<lista-classe-nice>'
+        '<classe-nice codigo="9"><especificacao>Software;</especificacao><status>Vigente</status></classe-nice>'
+        '<classe-nice codigo="42"><especificacao>Serviços;</especificacao></classe-nice>'
+        '</lista-classe-nice>'
+        '</processo>\n'
+    )
+
+
+def _revista(n: int, tail: str = "</revista>") -> bytes:
+    body = "".join(_processo(str(i)) for i in range(n))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<revista numero="2800" data="02/01/2024">\n{body}{tail}'
+    ).encode("utf-8")
+
+
+def _parallel(xml_bytes: bytes, **kwargs):
+    return parse_rm_records_parallel(xml_bytes, workers=4, min_chunk_bytes=1024, **kwargs)
+
+
+def test_parallel_matches_serial():
+    xml_bytes = _revista(500)
+    serial = list(iter_rm_records(xml_bytes))
+    assert len(serial) == 1000
+    assert _parallel(xml_bytes) == serial
+
+
+def test_split_counts_processos_per_chunk():
+    xml_bytes = _revista(500)
+    header, chunks, counts = structured_rm._split_rm_chunks(xml_bytes, 4)
+    assert len(chunks) == 4
+    assert header.endswith(b'<revista numero="2800" data="02/01/2024">\n')
+    assert counts == [c.count(b"<processo ") for c in chunks]
+    assert sum(counts) == 500
+    assert xml_bytes.startswith(header + b"".join(chunks))
+
+
+def test_parallel_keeps_unclosed_last_processo():
+    xml_bytes = _revista(500, tail='<processo numero="LAST"><marca><nome>LAST</nome></marca>'
+                                  '<lista-classe-nice><classe-nice codigo="9">')
+    serial = list(iter_rm_records(xml_bytes))
+    assert serial[-1].processo_numero == "LAST"
+    assert _parallel(xml_bytes) == serial
+
+
+def test_parallel_falls_back_when_pool_fails(monkeypatch):
+    class _BrokenPool:
+        def __init__(self, *args, **kwargs):
+            raise OSError("no more processes")
+
+    monkeypatch.setattr(structured_rm, "ProcessPoolExecutor", _BrokenPool)
+    xml_bytes = _revista(500)
+    assert _parallel(xml_bytes) == list(iter_rm_records(xml_bytes))